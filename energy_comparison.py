@@ -6,20 +6,34 @@ This script compares fixed-price and dynamic energy tariffs using hourly data fr
 It matches hourly energy consumption with ENTSO-E day-ahead prices for accurate dynamic tariff calculation.
 
 Requirements:
-- pip install entsoe-py pandas pytz
+- pip install entsoe-py pandas pyarrow
 - Home Assistant database with cumulative energy entities
 
 Configuration:
 Set the variables below to match your setup.
+
+Usage:
+python energy_comparison.py [--list-entities] [--no-csv]
 """
 
+import argparse
+import json
+import os
 import sqlite3
+import threading
 import datetime
-from datetime import timedelta
+from concurrent.futures import Future
+from datetime import timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+import numpy as np
 import pandas as pd
-import pytz
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from entsoe import EntsoePandasClient
 
+UTC = timezone.utc
+
 # ==================== USER-DEFINED VARIABLES ====================
 DB_PATH = "/path/to/your/home-assistant_v2.db"
 GRID_IMPORT_ENTITY = "sensor.your_import_entity"
@@ -36,85 +50,142 @@ BASE_DYNAMIC_KWH = 0.1492     # Base markup per kWh (added to ENTSO-E price)
 ENTSOE_API_KEY = "your_entsoe_api_key_here"  # API key from ENTSO-E
 ENTSOE_COUNTRY_CODE = "DE_LU"  # Country code (NL, DE, DK, etc.)
 TIMEZONE = "Europe/Amsterdam"  # Your local timezone
+ENTSOE_CACHE_DIR = os.environ.get("ENTSOE_CACHE_DIR", os.path.expanduser("~/.cache/entsoe"))  # Price cache database ("" disables)
+SQL_DEBUG = False  # Print executed SQL statements and SQLite VM step counts
+RUN_CACHE_DIR = ".cache"  # Hourly statistics of the last run, reused incrementally ("" disables)
 
 # Period (exactly 365 days)
-now_utc = datetime.datetime.now(pytz.UTC)
+now_utc = datetime.datetime.now(UTC)
 start_period = now_utc - timedelta(days=365)
 end_period = now_utc
 num_months = 12
 # ================================================================
 
+parser = argparse.ArgumentParser(description="Compare fixed and dynamic energy tariffs using Home Assistant long-term statistics.")
+parser.add_argument("--list-entities", action="store_true",
+                    help="list energy-related statistics in the database (full table scan)")
+parser.add_argument("--no-csv", dest="csv", action="store_false",
+                    help="skip the hourly CSV export")
+args = parser.parse_args()
+
 print(f"Energy Tariff Comparison - Using Long-Term Statistics")
 print(f"Period: {start_period.strftime('%Y-%m-%d %H:%M')} to {end_period.strftime('%Y-%m-%d %H:%M')} (UTC)")
 print("=" * 70)
 
-def get_statistics_data(db_conn, entity_id, start_dt, end_dt):
+def hourly_grid(start_dt, end_dt):
+    """
+    Hourly UTC timestamps of all full hours starting within the period.
+    """
+    return pd.date_range(pd.Timestamp(start_dt).ceil('h'), pd.Timestamp(end_dt).floor('h'), freq='h')
+
+def epoch_index(epoch_s):
+    """
+    UTC DatetimeIndex from whole epoch seconds, by integer cast instead of pd.to_datetime.
+    """
+    epoch_ns = epoch_s.astype(np.int64) * np.int64(10**9)
+    return pd.DatetimeIndex(epoch_ns.view('datetime64[ns]'), tz='UTC')
+
+sql_vm_steps = 0
+
+def count_vm_steps():
+    """
+    SQLite progress handler counting virtual machine steps (in units of 1000).
+    """
+    global sql_vm_steps
+    sql_vm_steps += 1000
+    return 0
+
+def open_database(db_path):
+    """
+    Open the Home Assistant database read-only, tuned for analytical reads.
+    """
+    # Read-only: never take write locks on the live recorder database. The path is
+    # percent-encoded into a file: URI. Prepared statements are cached per
+    # connection and reused across executions.
+    db_uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    db_conn = sqlite3.connect(db_uri, uri=True, cached_statements=256)
+    
+    # Per-connection read tuning: 64 MB page cache, in-memory temp b-trees
+    # (used by the window-function sorts) and memory-mapped I/O
+    db_conn.execute("PRAGMA cache_size=-65536")
+    db_conn.execute("PRAGMA temp_store=MEMORY")
+    db_conn.execute("PRAGMA mmap_size=268435456")
+    
+    if SQL_DEBUG:
+        db_conn.set_trace_callback(lambda statement: print(f"  [SQL] {statement.strip()}"))
+        db_conn.set_progress_handler(count_vm_steps, 1000)
+    
+    return db_conn
+
+META_IDS_SQL = "SELECT statistic_id, id FROM statistics_meta WHERE statistic_id IN (?, ?)"
+
+# Hourly consumption is the difference between consecutive cumulative sums of each
+# entity. It is computed in SQLite so only the deltas are returned; the hour before
+# the period is read as the predecessor of the first hour and negative deltas
+# (resets) are filtered out. {ts_col} is start_ts, or created_ts for older HA versions.
+STATS_SQL = """
+    SELECT metadata_id, start_ts, delta
+    FROM (
+        SELECT s.metadata_id, s.{ts_col} AS start_ts,
+               s.sum - LAG(s.sum) OVER (
+                   PARTITION BY s.metadata_id ORDER BY s.{ts_col}
+               ) AS delta
+        FROM statistics s
+        WHERE s.metadata_id IN (?, ?)
+        AND s.{ts_col} >= ?
+        AND s.{ts_col} <= ?
+    )
+    WHERE delta >= 0
+    AND start_ts >= ?
+    ORDER BY metadata_id, start_ts
+"""
+
+# Row layout of STATS_SQL results
+STATS_DTYPE = np.dtype([('metadata_id', np.int64), ('start_ts', np.float64), ('delta', np.float64)])
+
+def statistics_ts_column(db_conn):
+    """
+    Name of the statistics timestamp column (start_ts, or created_ts in older HA versions).
+    """
+    columns = {row[1] for row in db_conn.execute("PRAGMA table_info(statistics)")}
+    return 'start_ts' if 'start_ts' in columns else 'created_ts'
+
+def get_two_series(db_conn, import_id, export_id, start_dt, end_dt):
     """
-    Extract hourly energy data from Home Assistant long-term statistics.
+    Extract hourly import and export energy from Home Assistant long-term statistics
+    in a single query.
     """
     cursor = db_conn.cursor()
     
     start_ts = start_dt.timestamp()
     end_ts = end_dt.timestamp()
     
-    # Query to get statistics data
-    query = """
-        SELECT s.start_ts, s.sum, s.state
-        FROM statistics s
-        JOIN statistics_meta sm ON s.metadata_id = sm.id
-        WHERE sm.statistic_id = ?
-        AND s.start_ts >= ?
-        AND s.start_ts <= ?
-        ORDER BY s.start_ts ASC
-    """
+    # Resolve the metadata ids once so the statistics rows need no join and are
+    # purely numeric
+    cursor.execute(META_IDS_SQL, (import_id, export_id))
+    metadata_ids = dict(cursor.fetchall())
     
-    cursor.execute(query, (entity_id, start_ts, end_ts))
-    results = cursor.fetchall()
+    for entity_id in (import_id, export_id):
+        if entity_id not in metadata_ids:
+            raise ValueError(f"No statistics data found for entity '{entity_id}' in the specified period")
     
-    if not results:
-        # Try alternative query for older HA versions
-        query_old = """
-            SELECT s.created_ts as start_ts, s.sum, s.state
-            FROM statistics s
-            JOIN statistics_meta sm ON s.metadata_id = sm.id
-            WHERE sm.statistic_id = ?
-            AND s.created_ts >= ?
-            AND s.created_ts <= ?
-            ORDER BY s.created_ts ASC
-        """
-        cursor.execute(query_old, (entity_id, start_ts, end_ts))
-        results = cursor.fetchall()
-    
-    if not results:
-        raise ValueError(f"No statistics data found for entity '{entity_id}' in the specified period")
-    
-    # Convert to DataFrame
-    df = pd.DataFrame(results, columns=['start_ts', 'sum', 'state'])
-    
-    # Convert timestamp to datetime
-    df['timestamp'] = pd.to_datetime(df['start_ts'], unit='s', utc=True)
-    df = df.sort_values('timestamp')
-    df = df.set_index('timestamp')
-    
-    # Use sum column if available, otherwise use state
-    if df['sum'].notna().any():
-        # Sum represents cumulative consumption - calculate hourly difference
-        df['sum'] = pd.to_numeric(df['sum'], errors='coerce')
-        hourly_consumption = df['sum'].diff()
-        # First value is NaN from diff, use the sum value itself
-        hourly_consumption.iloc[0] = df['sum'].iloc[0]
-    else:
-        # Use state column
-        df['state'] = pd.to_numeric(df['state'], errors='coerce')
-        hourly_consumption = df['state']
+    params = (metadata_ids[import_id], metadata_ids[export_id], start_ts - 3600, end_ts, start_ts)
     
-    # Handle negative values (resets)
-    hourly_consumption[hourly_consumption < 0] = 0
+    # Stream the rows straight into a typed structured array instead of
+    # materializing a list of tuples with fetchall()
+    cursor.execute(STATS_SQL.format(ts_col=statistics_ts_column(db_conn)), params)
+    rows = np.fromiter(cursor, dtype=STATS_DTYPE)
     
-    # Drop NaN values
-    hourly_consumption = hourly_consumption.dropna()
+    # Rows are ordered by entity and time, so each entity is a contiguous block
+    # that is sliced out directly instead of building and pivoting a DataFrame
+    hourly = []
+    for entity_id in (import_id, export_id):
+        first = np.searchsorted(rows['metadata_id'], metadata_ids[entity_id], side='left')
+        last = np.searchsorted(rows['metadata_id'], metadata_ids[entity_id], side='right')
+        block = rows[first:last]
+        hourly.append(pd.Series(block['delta'], index=epoch_index(block['start_ts'])))
     
-    return hourly_consumption
+    return hourly[0], hourly[1]
 
 def list_available_statistics(db_conn):
     """
@@ -124,18 +195,143 @@ def list_available_statistics(db_conn):
     query = """
         SELECT sm.statistic_id, sm.source, sm.unit_of_measurement, 
                COUNT(s.id) as record_count,
-               MIN(s.start_ts) as first_record,
-               MAX(s.start_ts) as last_record
+               MIN(s.{ts_col}) as first_record,
+               MAX(s.{ts_col}) as last_record
         FROM statistics_meta sm
         LEFT JOIN statistics s ON sm.id = s.metadata_id
         WHERE sm.statistic_id LIKE '%grid%' OR sm.statistic_id LIKE '%energy%'
         GROUP BY sm.id
         ORDER BY sm.statistic_id
     """
-    cursor.execute(query)
+    cursor.execute(query.format(ts_col=statistics_ts_column(db_conn)))
     results = cursor.fetchall()
     return results
 
+# ENTSO-E price cache: raw prices per country and epoch second, plus the UTC days
+# (epoch second of midnight) that are stored completely
+PRICE_CACHE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entsoe_prices (
+        country TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        price REAL NOT NULL,
+        PRIMARY KEY (country, ts)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS entsoe_days (
+        country TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        PRIMARY KEY (country, day)
+    ) WITHOUT ROWID;
+"""
+
+# Row layout of cached price queries
+PRICES_DTYPE = np.dtype([('ts', np.int64), ('price', np.float64)])
+
+def open_price_cache(cache_dir):
+    """
+    Open the SQLite cache of ENTSO-E day-ahead prices, creating it if needed.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_conn = sqlite3.connect(os.path.join(cache_dir, "entsoe_prices.db"))
+    
+    # Write-side tuning: WAL journal, fsync only at checkpoints
+    cache_conn.execute("PRAGMA journal_mode=WAL")
+    cache_conn.execute("PRAGMA synchronous=NORMAL")
+    cache_conn.executescript(PRICE_CACHE_SCHEMA)
+    
+    return cache_conn
+
+def query_day_ahead_prices_cached(client, country_code, start_pd, end_pd):
+    """
+    Query day-ahead prices (EUR/MWh, UTC index), serving complete UTC days from the
+    local SQLite cache and fetching only the missing days.
+    """
+    one_day = pd.Timedelta(days=1)
+    cache_conn = open_price_cache(ENTSOE_CACHE_DIR) if ENTSOE_CACHE_DIR else None
+    frames = []
+    new_rows = []
+    new_days = []
+    
+    try:
+        if cache_conn is not None:
+            days = pd.date_range(start_pd.floor('D'), end_pd, freq='D')
+            first_day = int(days[0].timestamp())
+            last_day = int(days[-1].timestamp())
+            cached_days = {day for (day,) in cache_conn.execute(
+                "SELECT day FROM entsoe_days WHERE country = ? AND day BETWEEN ? AND ?",
+                (country_code, first_day, last_day)
+            )}
+            
+            # Group the missing days into contiguous ranges, so each gap costs a
+            # single API request
+            missing_ranges = []
+            for day in days:
+                if int(day.timestamp()) in cached_days:
+                    continue
+                if missing_ranges and missing_ranges[-1][1] == day:
+                    missing_ranges[-1][1] = day + one_day
+                else:
+                    missing_ranges.append([day, day + one_day])
+            
+            # All cached prices of the period in one primary-key range scan
+            cursor = cache_conn.execute(
+                "SELECT ts, price FROM entsoe_prices WHERE country = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (country_code, first_day, last_day + 86400)
+            )
+            cached = np.fromiter(cursor, dtype=PRICES_DTYPE)
+            frames.append(pd.Series(cached['price'], index=epoch_index(cached['ts'])))
+        else:
+            missing_ranges = [[start_pd, end_pd]]
+        
+        for range_start, range_end in missing_ranges:
+            prices = client.query_day_ahead_prices(
+                country_code=country_code,
+                start=range_start,
+                end=range_end
+            )
+            
+            # Ensure timezone aware
+            if prices.index.tz is None:
+                prices.index = prices.index.tz_localize('UTC')
+            else:
+                prices.index = prices.index.tz_convert('UTC')
+            
+            frames.append(prices)
+            
+            if cache_conn is None:
+                continue
+            
+            # Collect days that are over and have a price in each of their 24 hours.
+            # Points are not counted: 24 quarter-hour prices may cover only 6 hours.
+            for day in pd.date_range(range_start, range_end, freq='D', inclusive='left'):
+                if day + one_day > end_pd:
+                    break
+                day_prices = prices[(prices.index >= day) & (prices.index < day + one_day)].dropna()
+                if day_prices.index.floor('h').nunique() == 24:
+                    new_days.append((country_code, int(day.timestamp())))
+                    new_rows.extend(
+                        (country_code, ts, price)
+                        for ts, price in zip(day_prices.index.as_unit('s').asi8.tolist(), day_prices.tolist())
+                    )
+        
+        if new_days:
+            # A single transaction for all inserts instead of a commit per row
+            with cache_conn:
+                cache_conn.executemany(
+                    "INSERT OR REPLACE INTO entsoe_prices (country, ts, price) VALUES (?, ?, ?)", new_rows
+                )
+                cache_conn.executemany(
+                    "INSERT OR REPLACE INTO entsoe_days (country, day) VALUES (?, ?)", new_days
+                )
+    finally:
+        if cache_conn is not None:
+            cache_conn.close()
+    
+    if not frames:
+        return pd.Series(dtype=float)
+    
+    prices = pd.concat(frames).sort_index()
+    return prices[~prices.index.duplicated(keep='last')]
+
 def fetch_entsoe_prices(api_key, country_code, start_dt, end_dt):
     """
     Fetch hourly day-ahead prices from ENTSO-E.
@@ -143,15 +339,11 @@ def fetch_entsoe_prices(api_key, country_code, start_dt, end_dt):
     client = EntsoePandasClient(api_key=api_key)
     
     try:
-        # Convert datetime to pandas Timestamp with timezone
-        start_pd = pd.Timestamp(start_dt)
-        end_pd = pd.Timestamp(end_dt)
+        # Convert datetime to pandas Timestamp in UTC
+        start_pd = pd.Timestamp(start_dt).tz_convert('UTC')
+        end_pd = pd.Timestamp(end_dt).tz_convert('UTC')
         
-        prices = client.query_day_ahead_prices(
-            country_code=country_code,
-            start=start_pd,
-            end=end_pd
-        )
+        prices = query_day_ahead_prices_cached(client, country_code, start_pd, end_pd)
         
         if prices.empty:
             raise ValueError("No price data retrieved from ENTSO-E")
@@ -159,48 +351,146 @@ def fetch_entsoe_prices(api_key, country_code, start_dt, end_dt):
         # Convert from EUR/MWh to EUR/kWh
         prices = prices / 1000
         
-        # Ensure timezone aware
-        if prices.index.tz is None:
-            prices.index = prices.index.tz_localize('UTC')
-        else:
-            prices.index = prices.index.tz_convert('UTC')
+        # Average sub-hourly (15-minute MTU) prices per hour. The index is sorted,
+        # so each hour is a contiguous run and no resample/groupby is needed.
+        hours = prices.index.floor('h')
+        if not hours.is_unique:
+            starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+            counts = np.diff(np.r_[starts, len(prices)])
+            prices = pd.Series(np.add.reduceat(prices.to_numpy(), starts) / counts, index=hours[starts])
         
-        # Resample to hourly
-        prices = prices.resample('1H').mean().fillna(method='ffill')
+        # Align to the hourly grid of the requested period, filling gaps forward
+        prices = prices.reindex(hourly_grid(start_pd, end_pd), method='ffill')
         
         return prices
         
     except Exception as e:
         raise ValueError(f"Error fetching ENTSO-E data: {e}")
 
+def run_in_background(fn, *args):
+    """
+    Run fn(*args) on a daemon thread and return a Future for its result. Unlike a
+    ThreadPoolExecutor worker, the thread does not keep the interpreter alive, so
+    an abandoned call is dropped at exit instead of being waited for.
+    """
+    future = Future()
+    
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+def load_run_cache(cache_dir):
+    """
+    Load the hourly statistics persisted by the previous run together with the
+    timestamp up to which they are complete, or (None, None) if there is no cache
+    for the configured database and entities, or if it does not cover the start of
+    the period.
+    """
+    manifest_path = os.path.join(cache_dir, "last_run.json")
+    data_path = os.path.join(cache_dir, "last_run.parquet")
+    if not cache_dir or not os.path.exists(manifest_path) or not os.path.exists(data_path):
+        return None, None
+    
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    
+    key = (str(Path(DB_PATH).resolve()), GRID_IMPORT_ENTITY, GRID_EXPORT_ENTITY)
+    if (manifest.get('db_path'), manifest.get('import_entity'), manifest.get('export_entity')) != key:
+        return None, None
+    
+    # A period that starts before the cached data (e.g. a wider period) needs a full fetch
+    if 'first_ts' not in manifest or start_period.timestamp() < manifest['first_ts']:
+        return None, None
+    
+    return pd.read_parquet(data_path, columns=['import_kwh', 'export_kwh']), datetime.datetime.fromtimestamp(manifest['last_ts'], tz=UTC)
+
+def save_run_cache(cache_dir, import_hourly, export_hourly):
+    """
+    Persist the hourly statistics of this run for the next incremental run. Prices
+    are not persisted here: they are forward-filled over gaps, and the ENTSO-E price
+    cache already serves them incrementally.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    
+    hourly = pd.DataFrame({
+        'import_kwh': import_hourly,
+        'export_kwh': export_hourly
+    })
+    hourly.to_parquet(os.path.join(cache_dir, "last_run.parquet"), compression='zstd')
+    
+    # The data covers the period from its start and statistics are complete up to
+    # the last hour both entities have data for
+    manifest = {
+        'db_path': str(Path(DB_PATH).resolve()),
+        'import_entity': GRID_IMPORT_ENTITY,
+        'export_entity': GRID_EXPORT_ENTITY,
+        'first_ts': start_period.timestamp(),
+        'last_ts': min(import_hourly.index[-1], export_hourly.index[-1]).timestamp(),
+        'import_total': float(import_hourly.sum()),
+        'export_total': float(export_hourly.sum())
+    }
+    with open(os.path.join(cache_dir, "last_run.json"), "w") as f:
+        json.dump(manifest, f)
+
+# Reuse the hourly statistics of the previous run; only newer hours are fetched
+run_cache, cached_until = load_run_cache(RUN_CACHE_DIR)
+fetch_start = start_period
+if run_cache is not None and cached_until > start_period:
+    fetch_start = cached_until
+    print(f"Reusing cached statistics up to {cached_until.strftime('%Y-%m-%d %H:%M')} (UTC)")
+
 # Connect to database
-conn = sqlite3.connect(DB_PATH)
-tz = pytz.timezone(TIMEZONE)
+conn = open_database(DB_PATH)
+tz = ZoneInfo(TIMEZONE)
+
+# The ENTSO-E download is network-bound and independent of the database work,
+# so it runs in the background while the statistics are extracted. If a later
+# step fails, the download is abandoned rather than awaited at exit. Prices are
+# always requested for the whole period; the price cache fetches only missing days.
+prices_future = run_in_background(
+    fetch_entsoe_prices, ENTSOE_API_KEY, ENTSOE_COUNTRY_CODE, start_period, end_period
+)
 
 try:
-    print("\nStep 0: Checking available energy statistics...")
-    available_stats = list_available_statistics(conn)
-    
-    if available_stats:
-        print(f"  Found {len(available_stats)} energy-related statistics:")
-        for stat in available_stats[:10]:  # Show first 10
-            statistic_id, source, unit, count, first, last = stat
-            if count > 0:
-                first_dt = datetime.datetime.fromtimestamp(first, tz=pytz.UTC).strftime('%Y-%m-%d')
-                last_dt = datetime.datetime.fromtimestamp(last, tz=pytz.UTC).strftime('%Y-%m-%d')
-                print(f"    - {statistic_id}")
-                print(f"      Unit: {unit}, Records: {count}, Range: {first_dt} to {last_dt}")
+    if args.list_entities:
+        print("\nStep 0: Checking available energy statistics...")
+        available_stats = list_available_statistics(conn)
+        
+        if available_stats:
+            print(f"  Found {len(available_stats)} energy-related statistics:")
+            for stat in available_stats[:10]:  # Show first 10
+                statistic_id, source, unit, count, first, last = stat
+                if count > 0:
+                    first_dt = datetime.datetime.fromtimestamp(first, tz=UTC).strftime('%Y-%m-%d')
+                    last_dt = datetime.datetime.fromtimestamp(last, tz=UTC).strftime('%Y-%m-%d')
+                    print(f"    - {statistic_id}")
+                    print(f"      Unit: {unit}, Records: {count}, Range: {first_dt} to {last_dt}")
     
     print("\nStep 1: Extracting hourly energy data from statistics...")
     
     # Get hourly import and export data
-    import_hourly = get_statistics_data(
-        conn, GRID_IMPORT_ENTITY, start_period, end_period
-    )
-    export_hourly = get_statistics_data(
-        conn, GRID_EXPORT_ENTITY, start_period, end_period
+    import_hourly, export_hourly = get_two_series(
+        conn, GRID_IMPORT_ENTITY, GRID_EXPORT_ENTITY, fetch_start, end_period
     )
     
+    # Merge with the cached hours (fresh values win) and drop hours that left the period
+    if fetch_start > start_period:
+        import_hourly = import_hourly.combine_first(run_cache['import_kwh'].dropna())
+        export_hourly = export_hourly.combine_first(run_cache['export_kwh'].dropna())
+        import_hourly = import_hourly[import_hourly.index >= start_period]
+        export_hourly = export_hourly[export_hourly.index >= start_period]
+    
+    for entity_id, hourly in ((GRID_IMPORT_ENTITY, import_hourly), (GRID_EXPORT_ENTITY, export_hourly)):
+        if hourly.empty:
+            raise ValueError(f"No statistics data found for entity '{entity_id}' in the specified period")
+    
     total_import_kwh = import_hourly.sum()
     total_export_kwh = export_hourly.sum()
     
@@ -210,16 +500,17 @@ try:
     
     print("\nStep 2: Fetching ENTSO-E day-ahead prices...")
     
-    # Fetch ENTSO-E prices
-    entsoe_prices = fetch_entsoe_prices(
-        ENTSOE_API_KEY, ENTSOE_COUNTRY_CODE, start_period, end_period
-    )
+    # Wait for the ENTSO-E prices fetched in the background
+    entsoe_prices = prices_future.result()
     
-    print(f"  ✓ Price data retrieved: {len(entsoe_prices)} hours")
+    print(f"  ✓ Price data retrieved: {entsoe_prices.notna().sum()} hours")
     print(f"  ✓ Average price: {entsoe_prices.mean():.4f} EUR/kWh")
     print(f"  ✓ Min price: {entsoe_prices.min():.4f} EUR/kWh")
     print(f"  ✓ Max price: {entsoe_prices.max():.4f} EUR/kWh")
     
+    if RUN_CACHE_DIR:
+        save_run_cache(RUN_CACHE_DIR, import_hourly, export_hourly)
+    
     print("\nStep 3: Calculating tariff costs...")
     
     # ============ FIXED TARIFF CALCULATION ============
@@ -236,34 +527,35 @@ try:
     print(f"  TOTAL COST:                                          {total_fixed_cost:>10.2f} EUR")
     
     # ============ DYNAMIC TARIFF CALCULATION ============
-    # Align hourly consumption with prices
-    consumption_df = pd.DataFrame({
-        'import_kwh': import_hourly,
-        'export_kwh': export_hourly
-    })
-    
-    # Join with prices
-    combined = consumption_df.join(entsoe_prices.rename('price_eur_kwh'), how='inner')
-    
-    # Calculate hourly costs
-    combined['dynamic_price_total'] = combined['price_eur_kwh'] + BASE_DYNAMIC_KWH
-    combined['hourly_import_cost'] = combined['import_kwh'] * combined['dynamic_price_total']
-    combined['hourly_export_credit'] = combined['export_kwh'] * FIXED_EXPORT_PRICE
-    
-    dynamic_import_cost = combined['hourly_import_cost'].sum()
-    dynamic_export_credit = combined['hourly_export_credit'].sum()
+    # Align hourly consumption and prices on the canonical hourly grid of the
+    # period (hours without statistics count as zero consumption) and keep the
+    # hours that have a price
+    grid = hourly_grid(start_period, end_period)
+    import_kwh = import_hourly.reindex(grid, fill_value=0).to_numpy()
+    export_kwh = export_hourly.reindex(grid, fill_value=0).to_numpy()
+    price = entsoe_prices.reindex(grid).to_numpy()
+    
+    priced = ~np.isnan(price)
+    grid, import_kwh, export_kwh, price = grid[priced], import_kwh[priced], export_kwh[priced], price[priced]
+    
+    # Reduce the aligned arrays: the import cost is one dot product plus the markup
+    # on the matched consumption
+    matched_import_kwh = import_kwh.sum()
+    matched_export_kwh = export_kwh.sum()
+    dynamic_import_cost = np.dot(import_kwh, price) + BASE_DYNAMIC_KWH * matched_import_kwh
+    dynamic_export_credit = matched_export_kwh * FIXED_EXPORT_PRICE
     dynamic_base_cost = BASE_DYNAMIC_MONTHLY * num_months
     total_dynamic_cost = dynamic_import_cost - dynamic_export_credit + dynamic_base_cost
     
-    weighted_avg_price = (combined['hourly_import_cost'].sum() / combined['import_kwh'].sum()) if combined['import_kwh'].sum() > 0 else 0
+    weighted_avg_price = (dynamic_import_cost / matched_import_kwh) if matched_import_kwh > 0 else 0
     
     print(f"\n{'DYNAMIC TARIFF (Hourly Matching)':-^70}")
     print(f"  Avg ENTSO-E price:                                   {entsoe_prices.mean():>10.4f} EUR/kWh")
     print(f"  Base markup:                                         +{BASE_DYNAMIC_KWH:>9.4f} EUR/kWh")
     print(f"  Weighted avg price (consumption-matched):            {weighted_avg_price:>10.4f} EUR/kWh")
     print(f"  ")
-    print(f"  Import cost:      {combined['import_kwh'].sum():>10.2f} kWh (hourly rates) = {dynamic_import_cost:>10.2f} EUR")
-    print(f"  Export credit:    {combined['export_kwh'].sum():>10.2f} kWh × {FIXED_EXPORT_PRICE:.4f} = -{dynamic_export_credit:>9.2f} EUR")
+    print(f"  Import cost:      {matched_import_kwh:>10.2f} kWh (hourly rates) = {dynamic_import_cost:>10.2f} EUR")
+    print(f"  Export credit:    {matched_export_kwh:>10.2f} kWh × {FIXED_EXPORT_PRICE:.4f} = -{dynamic_export_credit:>9.2f} EUR")
     print(f"  Base fee:         {num_months:>10} months × {BASE_DYNAMIC_MONTHLY:.2f} = {dynamic_base_cost:>10.2f} EUR")
     print(f"  {'-'*70}")
     print(f"  TOTAL COST:                                          {total_dynamic_cost:>10.2f} EUR")
@@ -286,27 +578,51 @@ try:
     
     # ============ ADDITIONAL STATISTICS ============
     print(f"\n{'STATISTICS':-^70}")
-    print(f"  Hours analyzed:                                      {len(combined):>10}")
+    print(f"  Hours analyzed:                                      {len(grid):>10}")
     print(f"  Best hourly price:                                   {entsoe_prices.min():>10.4f} EUR/kWh")
     print(f"  Worst hourly price:                                  {entsoe_prices.max():>10.4f} EUR/kWh")
     print(f"  Price volatility (std dev):                          {entsoe_prices.std():>10.4f} EUR/kWh")
     
-    # Find hours with highest consumption
-    if len(combined) > 0:
-        top_hours = combined.nlargest(5, 'import_kwh')[['import_kwh', 'price_eur_kwh', 'dynamic_price_total']]
-        print(f"\n  Top 5 consumption hours:")
-        for idx, row in top_hours.iterrows():
-            print(f"    {idx.strftime('%Y-%m-%d %H:%M')} | {row['import_kwh']:.2f} kWh @ {row['dynamic_price_total']:.4f} EUR/kWh")
+    dynamic_price_total = price + BASE_DYNAMIC_KWH
     
-    # Export detailed CSV
-    output_file = "energy_comparison_hourly.csv"
-    combined.to_csv(output_file)
-    print(f"\n  📊 Detailed hourly data exported to: {output_file}")
+    # Find hours with highest consumption: a partial selection gives the fifth
+    # largest value, then all hours reaching it are ordered by consumption and time,
+    # so ties keep the earliest hours (as nlargest did)
+    if len(grid) > 0:
+        count = min(5, len(grid))
+        fifth = np.partition(import_kwh, -count)[-count]
+        top = np.flatnonzero(import_kwh >= fifth)
+        top = top[np.lexsort((top, -import_kwh[top]))][:5]
+        print(f"\n  Top 5 consumption hours:")
+        print("\n".join(
+            f"    {hour} | {kwh:.2f} kWh @ {rate:.4f} EUR/kWh"
+            for hour, kwh, rate in zip(
+                grid[top].strftime('%Y-%m-%d %H:%M'),
+                import_kwh[top],
+                dynamic_price_total[top]
+            )
+        ))
+    
+    # Export detailed CSV (Arrow's C++ writer instead of pandas' per-cell writer);
+    # the hourly table is only materialized for the export
+    if args.csv:
+        combined = pd.DataFrame({
+            'timestamp': grid,
+            'import_kwh': import_kwh,
+            'export_kwh': export_kwh,
+            'price_eur_kwh': price,
+            'dynamic_price_total': dynamic_price_total,
+            'hourly_import_cost': import_kwh * dynamic_price_total,
+            'hourly_export_credit': export_kwh * FIXED_EXPORT_PRICE
+        })
+        output_file = "energy_comparison_hourly.csv"
+        pacsv.write_csv(pa.Table.from_pandas(combined, preserve_index=False), output_file)
+        print(f"\n  📊 Detailed hourly data exported to: {output_file}")
     
 except Exception as e:
     print(f"\n❌ Error: {e}")
     print("\nTroubleshooting:")
-    print("  - Check the entity IDs listed above")
+    print("  - Check the entity IDs (run with --list-entities to list them)")
     print("  - Ensure entities have statistics enabled in Home Assistant")
     print("  - Verify ENTSO-E API key is valid")
     import traceback
@@ -314,6 +630,8 @@ except Exception as e:
     traceback.print_exc()
     
 finally:
+    if SQL_DEBUG:
+        print(f"\n  [SQL] SQLite VM steps: ~{sql_vm_steps}")
     conn.close()
 
 print("\n" + "=" * 70)